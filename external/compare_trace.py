@@ -1,5 +1,28 @@
 import sys
 import re
+from collections import deque
+from itertools import chain, islice
+from multiprocessing import Pool, cpu_count
+
+# Trace formats:
+#   Format 1 (Mesen2): "08000000 B $080000C0 R0:00000000 R1:00000000..."
+#   Format 2 (ayyboy_advance debug): "[debug ayyboy_advance::arm7tdmi::cpu] 08000000: b +184 [r0=00000000... sp=... lr=..."
+ADDRESS_RES = {
+    'format1': re.compile(r'^([0-9a-fA-F]{8})'),
+    'format2': re.compile(r'\] ([0-9a-fA-F]{8}):'),
+}
+
+# Single pass register tokenizer covering both formats
+REGISTER_RE = re.compile(
+    r'[Rr](\d+)[:=]([0-9a-fA-F]+)'
+    r'|([sS][pP]|[lL][rR])=([0-9a-fA-F]+)'
+)
+
+# r0 through r14 names for mismatch reports, indexed by register number
+REG_NAMES = tuple(f'r{i}' for i in range(15))
+
+# Number of aligned line pairs handed to a worker process at once
+CHUNK_LINES = 10000
 
 
 def detect_format(line):
@@ -10,103 +33,143 @@ def detect_format(line):
         return 'format1'  # Mesen2 trace format
 
 
-def parse_line(line):
-    """Parse a trace line to extract address and register values."""
-    format_type = detect_format(line)
-    address = "unknown"
-    registers = {}
-    
-    if format_type == 'format1':
-        # Format 1: "08000000 B $080000C0 R0:00000000 R1:00000000..."
-        # Extract address from the beginning
-        addr_match = re.match(r'^([0-9a-fA-F]{8})', line)
-        if addr_match:
-            address = "0x" + addr_match.group(1).lower()
-            
-        # Extract register values - handle both uppercase and lowercase
-        reg_matches = re.findall(r'[Rr](\d+):([0-9a-fA-F]+)', line)
-        for reg_num, reg_val in reg_matches:
-            if int(reg_num) <= 14:  # r0 through r14
-                registers[f'r{reg_num.lower()}'] = int(reg_val, 16)
-    
-    else:  # format2
-        # Format 2: "[debug ayyboy_advance::arm7tdmi::cpu] 08000000: b +184 [r0=00000000..."
-        # Extract address
-        addr_match = re.search(r'\] ([0-9a-fA-F]{8}):', line)
-        if addr_match:
-            address = "0x" + addr_match.group(1).lower()
-            
-        # Extract normal registers
-        reg_matches = re.findall(r'[Rr](\d+)=([0-9a-fA-F]+)', line)
-        for reg_num, reg_val in reg_matches:
-            if int(reg_num) <= 14:  # r0 through r14
-                registers[f'r{reg_num.lower()}'] = int(reg_val, 16)
-                
-        # Extract special registers (sp, lr)
-        sp_match = re.search(r'sp=([0-9a-fA-F]+)', line, re.IGNORECASE)
-        if sp_match:
-            registers['r13'] = int(sp_match.group(1), 16)
-            
-        lr_match = re.search(r'lr=([0-9a-fA-F]+)', line, re.IGNORECASE)
-        if lr_match:
-            registers['r14'] = int(lr_match.group(1), 16)
-    
-    if address == "unknown":
+def sniff_format(lines):
+    """Detect the format of a trace from its first line, returning it along with all lines."""
+    lines = iter(lines)
+    first_line = next(lines, None)
+    if first_line is None:
+        return 'format1', lines
+    return detect_format(first_line), chain([first_line], lines)
+
+
+def parse_address(line, format_type):
+    """Parse a trace line to extract only the instruction address."""
+    addr_match = ADDRESS_RES[format_type].search(line)
+    if not addr_match:
         raise ValueError(f"Address not found in line: {line.strip()}")
-            
-    return address, registers
+
+    return "0x" + addr_match.group(1).lower()
+
+
+def parse_registers(line):
+    """
+    Parse a trace line to extract the raw register hex strings.
+    Returns (mask, registers) where registers holds r0 through r14 by index
+    and bit i of mask is set when register i was present in the line.
+    Register values are only converted to integers by the caller when the strings differ.
+    """
+    mask = 0
+    registers = [None] * 15
+
+    # findall hands back plain tuples, avoiding a Match object and group() calls per token
+    for reg_num, reg_val, special, special_val in REGISTER_RE.findall(line):
+        if reg_val:
+            reg_index = int(reg_num)
+            if reg_index <= 14:  # r0 through r14
+                registers[reg_index] = reg_val
+                mask |= 1 << reg_index
+        else:
+            reg_index = 13 if special.lower() == 'sp' else 14
+            registers[reg_index] = special_val
+            mask |= 1 << reg_index
+
+    return mask, registers
+
+
+def fold_bll_pairs(lines):
+    """Yield format1 trace lines, merging each BLL/BLH pair into its BLL line."""
+    pending = None
+    for line in lines:
+        if pending is not None:
+            yield pending
+            pending = None
+            if 'BLH' in line:
+                # BLL/BLH are handled as a single instruction, so drop the BLH line
+                continue
+        if 'BLL' in line:
+            # Hold the BLL line back until we know whether a BLH follows
+            pending = line
+        else:
+            yield line
+    if pending is not None:
+        yield pending
+
+
+def compare_lines(line_num, line1, line2, formats):
+    """Compare two aligned trace lines, returning the mismatch report lines (empty if they match)."""
+    # Compare addresses first, the registers only need parsing when they match
+    addr1 = parse_address(line1, formats[0])
+    addr2 = parse_address(line2, formats[1])
+    if addr1 != addr2:
+        return [f"Address mismatch: {addr1} vs {addr2}", f"Line {line_num} mismatch detected"]
+
+    mask1, regs1 = parse_registers(line1)
+    mask2, regs2 = parse_registers(line2)
+
+    # Fast path, compare all registers at once and only walk them on a difference.
+    # Identical hex strings are identical values, so no int conversion is needed here.
+    if regs1 == regs2:
+        return []
+
+    report = []
+
+    # Check registers present in both lines
+    common = mask1 & mask2
+    for i, reg_name in enumerate(REG_NAMES):
+        if common >> i & 1:
+            # Strings may still differ in case or zero padding, so compare the values
+            val1 = int(regs1[i], 16)
+            val2 = int(regs2[i], 16)
+            if val1 != val2:
+                report.append(f"{reg_name} mismatch at {addr1}: "
+                              f"0x{val1:08x} vs 0x{val2:08x}")
+
+    if report:
+        report.append(f"Line {line_num} mismatch detected")
+    return report
+
+
+def compare_chunk(first_line_num, pairs, formats):
+    """Compare a chunk of aligned line pairs, returning the report of the first mismatch (empty if none)."""
+    for line_num, (line1, line2) in enumerate(pairs, first_line_num):
+        report = compare_lines(line_num, line1, line2, formats)
+        if report:
+            return report
+    return []
+
+
+def iter_chunk_reports(pool, pairs, formats, window):
+    """Hand chunks of aligned line pairs to the pool, yielding each chunk's report in order."""
+    in_flight = deque()
+    line_num = 1
+    for chunk in iter(lambda: list(islice(pairs, CHUNK_LINES)), []):
+        in_flight.append(pool.apply_async(compare_chunk, (line_num, chunk, formats)))
+        line_num += len(chunk)
+        # Bound the chunks in flight so memory stays flat on large traces
+        if len(in_flight) >= window:
+            yield in_flight.popleft().get()
+    while in_flight:
+        yield in_flight.popleft().get()
 
 
 def compare_traces(file1, file2):
     """Compare two trace files line by line."""
-    with open(file1, 'r') as f1, open(file2, 'r') as f2:
-        line_num = 0
-        lines1 = f1.readlines()
-        lines2 = f2.readlines()
-        
-        i1 = 0
-        i2 = 0
-        
-        while i1 < len(lines1) and i2 < len(lines2):
-            line_num += 1
-            line1 = lines1[i1]
-            line2 = lines2[i2]
-            
-            # Check for BLL/BLH pair in format1
-            skip_next_line1 = False
-            if detect_format(line1) == 'format1' and 'BLL' in line1 and i1+1 < len(lines1) and 'BLH' in lines1[i1+1]:
-                # We'll handle this as a single instruction, so next iteration should skip a line
-                skip_next_line1 = True
-                # For the comparison, we'll use the BLL line but take note that it's a paired instruction
-                # print(f"Note: BLL/BLH instruction pair at line {line_num}")
-            
-            # Parse both lines
-            addr1, regs1 = parse_line(line1)
-            addr2, regs2 = parse_line(line2)
-            
-            failed = False
-
-            # Check if addresses match (case-insensitive)
-            if addr1.lower() != addr2.lower():
-                print(f"Address mismatch: {addr1} vs {addr2}")
-                failed = True
-            
-            # Check registers
-            for i in range(15):  # r0 through r14
-                reg_name = f'r{i}'
-                if reg_name in regs1 and reg_name in regs2:
-                    if regs1[reg_name] != regs2[reg_name]:
-                        print(f"{reg_name} mismatch at {addr1}: "
-                              f"0x{regs1[reg_name]:08x} vs 0x{regs2[reg_name]:08x}")
-                        failed = True
-
-            if failed:
-                print(f"Line {line_num} mismatch detected")
-                return False
-            
-            # Move to next line(s)
-            i1 += 2 if skip_next_line1 else 1
-            i2 += 1
+    # Stream both files instead of reading them into memory, traces can be several GB.
+    # Lines are aligned (and BLL/BLH pairs folded) here, parsing and comparing is spread
+    # over worker processes. Reports come back in order, so the first one is the earliest mismatch.
+    with open(file1, 'r', buffering=1 << 20) as f1, open(file2, 'r', buffering=1 << 20) as f2:
+        # The format is stable across a trace, so detect it once per file rather than per line
+        format_type1, lines1 = sniff_format(f1)
+        format_type2, lines2 = sniff_format(f2)
+        if format_type1 == 'format1':
+            lines1 = fold_bll_pairs(lines1)
+
+        pairs = zip(lines1, lines2)
+        with Pool() as pool:
+            for report in iter_chunk_reports(pool, pairs, (format_type1, format_type2), 2 * cpu_count()):
+                if report:
+                    print("\n".join(report))
+                    return False
     return True
 
 
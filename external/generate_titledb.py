@@ -21,11 +21,45 @@ Usage:
 """
 
 import xml.etree.ElementTree as ET
-import csv
 import sys
 
 # Order to check features for savetype, lower-case
 SAVETYPE_FEATURE_ORDER = ["slot", "u1", "u2", "savetype", "save"]
+SAVETYPE_FEATURE_RANK = {name: rank for rank, name in enumerate(SAVETYPE_FEATURE_ORDER)}
+
+# Number of CSV rows to buffer before each write
+CSV_ROWS_PER_WRITE = 1024
+
+
+def quote_csv_field(text):
+    """
+    Quote a CSV field the way csv.writer does with QUOTE_MINIMAL.
+    """
+    if ',' in text or '"' in text or '\r' in text or '\n' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+# Savetype strings MAME emits (slot names and plain names), lower-case, mapped to their code
+SAVETYPE_CODES = {
+    "": 0,
+    "gba_eeprom": 1,
+    "gba_eeprom_4k": 1,
+    "gba_eeprom_64k": 2,
+    "gba_sram": 3,
+    "gba_flash_512": 4,
+    "gba_flash": 5,
+    "gba_flash_rtc": 5,
+    "gba_flash_1m": 5,
+    "gba_flash_1m_rtc": 5,
+    "eeprom": 1,
+    "eeprom_4k": 1,
+    "eeprom_64k": 2,
+    "sram": 3,
+    "flash_512k": 4,
+    "flash": 5,
+    "flash_1m": 5,
+}
 
 
 def map_savetype_to_code(savetype_str):
@@ -39,29 +73,37 @@ def map_savetype_to_code(savetype_str):
       5: Flash 1M
     """
     s = savetype_str.lower()
-    if not s:
-        return 0
+    code = SAVETYPE_CODES.get(s)
+    if code is not None:
+        return code
+
+    # Free-form text (e.g. chip labels), classify by substring and remember the result
     if 'eeprom' in s:
-        return 2 if '64' in s else 1
-    if 'sram' in s:
-        return 3
-    if 'flash' in s:
-        return 4 if '512' in s or '512k' in s else 5
-    return 0
+        code = 2 if '64' in s else 1
+    elif 'sram' in s:
+        code = 3
+    elif 'flash' in s:
+        code = 4 if '512' in s or '512k' in s else 5
+    else:
+        code = 0
+    SAVETYPE_CODES[s] = code
+    return code
 
 
 def parse_gba_xml_to_csv(xml_file_path, csv_file_path):
-    # Load XML
-    with open(xml_file_path, "r", encoding="utf-8") as f:
-        root = ET.fromstring(f.read())
-
     seen_crcs = set()
     # Write CSV
     with open(csv_file_path, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["crc32", "savetype_code", "rtc", "description"])
+        # Rows are formatted directly and written in batches, crc/codes never need quoting
+        rows = ["crc32,savetype_code,rtc,description\r\n"]
+
+        # Stream the XML, only one <software> subtree is kept in memory at a time
+        events = ET.iterparse(xml_file_path, events=("start", "end"))
+        _, root = next(events)
+        for event, software in events:
+            if event != "end" or software.tag != "software":
+                continue
 
-        for software in root.findall('.//software'):
             # CRC32
             crc = ''
             part = software.find('part')
@@ -74,6 +116,7 @@ def parse_gba_xml_to_csv(xml_file_path, csv_file_path):
 
             # Skip duplicates
             if not crc or crc in seen_crcs:
+                root.clear()
                 continue
             seen_crcs.add(crc)
 
@@ -81,35 +124,41 @@ def parse_gba_xml_to_csv(xml_file_path, csv_file_path):
             desc_elem = software.find('description')
             description = desc_elem.text.strip() if desc_elem is not None else ''
 
-            # RTC flag
+            # Savetype string, prioritizing the software attribute, then SAVETYPE_FEATURE_ORDER
+            savetype_attr = software.get('savetype')
+            savetype_str = savetype_attr.strip() if savetype_attr else ''
+            # -1 means the attribute already won and features are only checked for RTC
+            savetype_rank = -1 if savetype_attr else len(SAVETYPE_FEATURE_ORDER)
+
+            # RTC flag and savetype feature, in a single pass over the features
             has_rtc = 0
-            # Gather features
-            feature_map = {}
             if part is not None:
-                for feat in part.findall('feature'):
-                    name = feat.get('name', '').lower()
+                for feat in part.iterfind('feature'):
+                    name = feat.get('name', '')
                     val = feat.get('value', '').strip()
                     if not name or not val:
                         continue
-                    feature_map[name] = val
-                    if 'rtc' in val.lower():
+                    if not has_rtc and 'rtc' in val.lower():
                         has_rtc = 1
-
-            # Determine savetype string, prioritizing slot
-            savetype_str = ''
-            # 1. software attribute
-            if software.get('savetype'):
-                savetype_str = software.get('savetype').strip()
-            else:
-                # 2. feature order
-                for key in SAVETYPE_FEATURE_ORDER:
-                    if key in feature_map:
-                        savetype_str = feature_map[key]
-                        break
+                        if savetype_rank < 0:
+                            break
+                    # Later features with the same name override earlier ones
+                    rank = SAVETYPE_FEATURE_RANK.get(name.lower())
+                    if rank is not None and rank <= savetype_rank:
+                        savetype_str = val
+                        savetype_rank = rank
 
             savetype_code = map_savetype_to_code(savetype_str)
 
-            writer.writerow([crc, savetype_code, has_rtc, description])
+            rows.append(f"{crc},{savetype_code},{has_rtc},{quote_csv_field(description)}\r\n")
+            if len(rows) >= CSV_ROWS_PER_WRITE:
+                csvfile.write("".join(rows))
+                rows.clear()
+
+            # Drop the processed subtree
+            root.clear()
+
+        csvfile.write("".join(rows))
 
 
 if __name__ == '__main__':